@@ -14,9 +14,42 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-import serial
+import socket
+import struct
+import time
 import logging
 
+try:
+    import serial
+except ImportError:
+    serial = None
+
+# event types
+HIT = 1 # values: marker id
+DISTANCE = 2 # values: distance in pixels, angle in degrees
+CALIBRATION = 3 # values: True if calibration succeeded
+
+# binary event: sequence number, timestamp, event type, two values
+EVENT_FORMAT = '<IdBff'
+
+
+class Outputs():
+    ''' dispatch events to all output sinks '''
+    def __init__(self):
+        self.sinks = []
+
+    def add(self, sink):
+        self.sinks.append(sink)
+
+    def publish(self, event, *values):
+        for sink in self.sinks:
+            sink.publish(event, *values)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
 class Serial():
     ''' handle serial port communication '''
     def __init__(self, port):
@@ -30,5 +63,53 @@ class Serial():
         if self.ser.is_open:
             self.ser.write(data + '\r\n')
 
+    def publish(self, event, *values):
+        ''' write events using the serial text protocol, hits are not sent '''
+        if event == DISTANCE:
+            distance, angle = values
+            self.write(str(int(distance)).zfill(4) + str(int(angle)).zfill(4))
+        elif event == CALIBRATION:
+            self.write('S' if values[0] else 'F')
+
     def close(self):
         self.ser.close()
+
+
+class Publisher():
+    ''' fan out binary events to local subscribers over UDP and Unix datagram sockets '''
+    def __init__(self, subscribers):
+        self.seq = 0
+        self.dropped = 0 # events not delivered to a subscriber
+        self.subscribers = []
+        self.socks = {}
+        for address in subscribers:
+            # a string is a Unix socket path, a tuple is an (ip, port) pair
+            if isinstance(address, str):
+                family = socket.AF_UNIX
+            elif ':' in address[0]:
+                family = socket.AF_INET6
+            else:
+                family = socket.AF_INET
+            if family not in self.socks:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+                # never wait for a slow subscriber
+                sock.setblocking(0)
+                self.socks[family] = sock
+            self.subscribers.append((self.socks[family], address))
+            logging.info('Publishing events to ' + str(address))
+
+    def publish(self, event, *values):
+        values = (list(values) + [0, 0])[:2]
+        packet = struct.pack(EVENT_FORMAT, self.seq, time.time(), event, values[0], values[1])
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        for sock, address in self.subscribers:
+            try:
+                sock.sendto(packet, address)
+            except socket.error:
+                # subscriber is gone or its buffer is full, drop the event
+                self.dropped += 1
+
+    def close(self):
+        for sock in self.socks.values():
+            sock.close()
+        logging.info('Published ' + str(self.seq) + ' events, dropped ' + str(self.dropped) + ' deliveries')
@@ -34,3 +34,28 @@ GAZE_OFFSET_X = 0 # gaze X offset
 GAZE_OFFSET_Y = 0 # gaze Y offset
 GAZE_THRESHOLD = 10 # detection threshold
 
+# stream recovery
+VIDEO_STALL_TIMEOUT = 2.0 # seconds without a video frame before the stream is considered stalled
+VIDEO_OPEN_TIMEOUT = 10.0 # seconds allowed to open the video stream before the capture process is restarted
+DATA_STALL_TIMEOUT = 2.0 # seconds without a data packet before the stream is considered stalled
+RECONNECT_BACKOFF_MIN = 0.5 # initial delay between reconnection attempts in seconds
+RECONNECT_BACKOFF_MAX = 8.0 # maximum delay between reconnection attempts in seconds
+HTTP_TIMEOUT = 1.0 # REST API request timeout in seconds
+CALIBRATION_POLL_INTERVAL = 0.5 # seconds between calibration status requests
+
+# annotated session recording
+RECORD_FILE = None # output video file, eg. 'session.avi', None to disable recording
+RECORD_SIZE = (1280, 720) # recording resolution (width, height)
+RECORD_FPS = 25 # recording frame rate
+RECORD_FOURCC = 'XVID' # recording codec
+RECORD_QUEUE_SIZE = 4 # frames buffered for the encoder before dropping
+
+# event publishing
+PUBLISH_SUBSCRIBERS = [] # local event subscribers, (ip, port) pairs for UDP or paths for Unix sockets, eg. [('127.0.0.1', 50000), '/tmp/gazecontrol.sock']
+
+# marker board
+BOARD_LAYOUT = {} # marker id: (x, y, size), top-left corner and side length in board units (eg. mm), empty to disable
+BOARD_MIN_MARKERS = 2 # visible board markers needed to estimate the board homography, with fewer the cached one is kept while it fits them
+BOARD_REPROJECTION_ERROR = 5.0 # max reprojection error in pixels, for RANSAC and for keeping the cached homography
+BOARD_MAX_AGE = 15 # frames a cached homography stays valid without a fresh estimate
+BOARD_DETECT_INTERVAL = 1 # run marker detection every N frames while the board homography is valid
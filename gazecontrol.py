@@ -18,9 +18,11 @@
 import cv2
 import video_capture as vc
 import video_processing as vp
+import video_recorder as vr
 import tobii_api
 import logging
 import com_utils
+import net_utils
 import config
 import time
 
@@ -61,12 +63,22 @@ if __name__=='__main__':
 
     # init all object and start capturing
 
+    outputs = com_utils.Outputs()
     if output_port is not None and serial_available:
-        serialport = com_utils.Serial(output_port)
+        outputs.add(com_utils.Serial(output_port))
+    if len(config.PUBLISH_SUBSCRIBERS) > 0:
+        outputs.add(com_utils.Publisher(config.PUBLISH_SUBSCRIBERS))
 
     peer = (config.DATA_STREAM_IP, config.DATA_STREAM_PORT)
     buffersync = tobii_api.BufferSync()
-    video = vp.VideoProcessing(peer)
+
+    # optional annotated session recording
+    recorder = None
+    if config.RECORD_FILE is not None:
+        recorder = vr.RecordProcess(config.RECORD_FILE, (1080, 1920, 3))
+        recorder.start()
+
+    video = vp.VideoProcessing(peer, recorder)
 
     captureProcess = vc.CaptureProcess(config.VIDEO_STREAM_URI, (1080, 1920, 3), config.USE_MULTIPROCESSING)
     captureProcess.start()
@@ -76,6 +88,8 @@ if __name__=='__main__':
 
 
     lastdata = None
+    # watchdog for a capture process blocked on a dead stream
+    videostall = net_utils.StallDetector(config.VIDEO_STALL_TIMEOUT, config.VIDEO_OPEN_TIMEOUT, config.VIDEO_OPEN_TIMEOUT, config.VIDEO_OPEN_TIMEOUT)
 
     framecounter = 0
     newframetime = 0
@@ -83,39 +97,55 @@ if __name__=='__main__':
     framestocount = 20
     while(running):
         et.read()
+        if et.stall.stalled:
+            # gaze is frozen while the data stream is down, sync restarts from scratch on recovery
+            lastdata = None
 
         # read a video frame from video capture process
         frame, pts = captureProcess.read()
-        buffersync.add_pts(pts)
-        framecounter = framecounter + 1
-
-        if framecounter % framestocount == 0:
-            newframetime = time.time() 
-            logging.info('FPS: ' + str(framestocount/(newframetime-lastframetime)))
-            lastframetime = time.time()
-        # read data from stream
-        data = buffersync.sync()
-        if data is not None:
-            lastdata = data
-
-        # detect fiducials
-        id, serialangledist = video.detect(frame, lastdata)
-        # write hits to serial port
-        if serialangledist is not None and output_port is not None:
-            serialport.write(serialangledist)
-            logging.info('Serialangledist: '+serialangledist)
+        if frame is None:
+            # no frame in time, replace the capture process and restart the video session
+            if videostall.poll():
+                logging.warning('WARNING: Video stream stalled, restarting capture')
+                captureProcess.restart()
+                video.restart()
+        else:
+            recovery = videostall.feed()
+            if recovery is not None:
+                # pts restart with the new stream, drop stale sync state
+                logging.info('Video stream recovered after %.2fs (%d outages)' % (recovery, videostall.outages))
+                buffersync.reset()
+                lastdata = None
+
+            buffersync.add_pts(pts)
+            framecounter = framecounter + 1
+
+            if framecounter % framestocount == 0:
+                newframetime = time.time() 
+                logging.info('FPS: ' + str(framestocount/(newframetime-lastframetime)))
+                lastframetime = time.time()
+            # read data from stream
+            data = buffersync.sync()
+            if data is not None:
+                lastdata = data
+
+            # detect fiducials
+            id, angledist = video.detect(frame, lastdata)
+            # publish hits and distances
+            if id is not None:
+                outputs.publish(com_utils.HIT, id)
+            if angledist is not None:
+                outputs.publish(com_utils.DISTANCE, *angledist)
 
 
 
         status = calibration.update()
         if status == 'failed':
             logging.warn('WARNING: Calibration failed, using default calibration instead')
-            if output_port is not None:
-                serialport.write('F')
+            outputs.publish(com_utils.CALIBRATION, False)
         elif status == 'calibrated':
             logging.info('Calibration successful')
-            if output_port is not None:
-                serialport.write('S')
+            outputs.publish(com_utils.CALIBRATION, True)
 
         if not config.HEADLESS:
             key = cv2.waitKey(1)
@@ -127,8 +157,10 @@ if __name__=='__main__':
 
 
     # shutdown
+    logging.info('Video outages: %d (%.1fs down, %d reopens, %d capture restarts), data outages: %d (%.1fs down)' % (videostall.outages, videostall.downtime, captureProcess.reopens(), captureProcess.respawns, et.stall.outages, et.stall.downtime))
     captureProcess.stop()
     video.stop()
+    if recorder is not None:
+        recorder.stop()
     et.stop()
-    if output_port is not None:
-        serialport.close()
+    outputs.close()
@@ -18,6 +18,10 @@ import socket
 import urllib2
 import json
 import time
+import config
+
+# errors raised by REST requests when the link is down
+HTTP_ERRORS = (urllib2.URLError, socket.error)
 
 def mksock(peer):
     ''' Create a socket pair for a peer description '''
@@ -33,7 +37,7 @@ def post_request(base_url, api_action, data=None):
     req = urllib2.Request(url)
     req.add_header('Content-Type', 'application/json')
     data = json.dumps(data)
-    response = urllib2.urlopen(req, data)
+    response = urllib2.urlopen(req, data, config.HTTP_TIMEOUT)
     data = response.read()
     json_data = json.loads(data)
     return json_data
@@ -44,10 +48,67 @@ def wait_for_status(base_url, api_action, key, values):
     url = base_url + api_action
     req = urllib2.Request(url)
     req.add_header('Content-Type', 'application/json')
-    response = urllib2.urlopen(req, None)
+    response = urllib2.urlopen(req, None, config.HTTP_TIMEOUT)
     data = response.read()
     json_data = json.loads(data)
     if json_data[key] in values:
         return json_data[key]
     else:
-        return None
\ No newline at end of file
+        return None
+
+
+class StallDetector():
+    ''' detect a stalled stream from arrival times and schedule reconnections with backoff '''
+    def __init__(self, timeout, backoff_min, backoff_max, start_timeout=None):
+        self.timeout = timeout
+        self.start_timeout = start_timeout if start_timeout is not None else timeout # allowed before the first arrival
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.backoff = backoff_min
+        self.last_arrival = time.time()
+        self.started = False # set on the first arrival
+        self.stalled = False
+        self.outage_start = None
+        self.next_retry = 0
+        self.outages = 0 # number of outages so far
+        self.downtime = 0 # total time spent in outage, in seconds
+
+    def reset(self):
+        ''' restart the arrival timer, eg. after (re)opening the stream '''
+        self.last_arrival = time.time()
+
+    def feed(self):
+        ''' record an arrival, return the outage duration if the stream just recovered '''
+        now = time.time()
+        self.last_arrival = now
+        self.started = True
+        if not self.stalled:
+            return None
+        self.stalled = False
+        self.backoff = self.backoff_min
+        if self.outage_start is None:
+            # the stream came up for the first time, this was not an outage
+            return None
+        recovery = now - self.outage_start
+        self.downtime += recovery
+        return recovery
+
+    def poll(self):
+        ''' check for a stall, return True when a reconnection attempt is due '''
+        now = time.time()
+        if not self.stalled:
+            timeout = self.timeout if self.started else self.start_timeout
+            if now - self.last_arrival < timeout:
+                return False
+            # nothing arrived in time, retry and count an outage if the stream was ever up
+            self.stalled = True
+            self.next_retry = now
+            self.outage_start = None
+            if self.started:
+                self.outages += 1
+                self.outage_start = self.last_arrival
+        if now >= self.next_retry:
+            self.next_retry = now + self.backoff
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+            return True
+        return False
@@ -21,6 +21,7 @@ import time
 import threading
 import logging
 import net_utils
+import config
 
 class KeepAlive:
     ''' Sends keep-alive signals to a peer via a socket (Livestream API) '''
@@ -32,13 +33,20 @@ class KeepAlive:
             'op' : 'start',
             'type' : '.'.join(['live', streamtype, 'unicast']),
             'key' : 'anything'})
-        sock.sendto(jsonobj, peer)
+        self.__send(sock, jsonobj, peer)
         td = threading.Timer(0, self.__send_keepalive_msg, [sock, jsonobj, peer])
         td.start()
 
-    def __send_keepalive_msg(self, socket, jsonobj, peer):
+    def __send(self, sock, jsonobj, peer):
+        # a dropped link must not kill the keep-alive, keep trying until stopped
+        try:
+            sock.sendto(jsonobj, peer)
+        except socket.error as e:
+            logging.debug('Keep-alive not sent: ' + str(e))
+
+    def __send_keepalive_msg(self, sock, jsonobj, peer):
         while self.running:
-            socket.sendto(jsonobj, peer)
+            self.__send(sock, jsonobj, peer)
             time.sleep(self.timeout)
 
     def stop(self):
@@ -54,6 +62,14 @@ class BufferSync():
     last_video_pts = 0 # video pts corresponding to the last sync packet
     last_data_ts = 0 # ts of the last pts sync packet
 
+    def reset(self):
+        ''' Discard all sync state, eg. after a stream was reopened and pts/ts restarted '''
+        self.et_syncs = []
+        self.et_queue = []
+        self.video_pts = 0
+        self.last_video_pts = 0
+        self.last_data_ts = 0
+
     def add_et(self, obj):
         ''' Store sync packets and gaze positions '''
         if 'pts' in obj:
@@ -103,20 +119,36 @@ class EyeTracking():
 
     def __init__(self, buffersync):
         self.buffersync = buffersync
+        self.stall = net_utils.StallDetector(config.DATA_STALL_TIMEOUT, config.RECONNECT_BACKOFF_MIN, config.RECONNECT_BACKOFF_MAX)
 
     def start(self, peer):
+        self.peer = peer
+        self.stall.reset()
         # start data Keep-Alive
         self.sock = net_utils.mksock(peer)
         self.sock.setblocking(0)
         self.keepalive = KeepAlive(self.sock, peer, 'data')
 
+    def restart(self):
+        ''' reopen the Livestream data session '''
+        logging.warning('WARNING: Data stream stalled, restarting Livestream session')
+        self.stop()
+        self.start(self.peer)
+
     def read(self):
         while True:
             # get raw data is available
             try:
                 data, address = self.sock.recvfrom(1024)
             except socket.error:
+                # no data, check for a stalled stream
+                if self.stall.poll():
+                    self.restart()
                 return None
+            recovery = self.stall.feed()
+            if recovery is not None:
+                logging.info('Data stream recovered after %.2fs (%d outages)' % (recovery, self.stall.outages))
+                self.buffersync.reset()
             # convert to JSON and store
             dict = json.loads(data)
             self.buffersync.add_et(dict)
@@ -131,6 +163,8 @@ class EyeTracking():
 class Calibration():
     ''' calibrate the glasses using the Tobii REST API '''
     is_calibrating = False
+    next_poll = 0 # time of the next status request
+    poll_interval = config.CALIBRATION_POLL_INTERVAL
 
     def __create_project(self):
         json_data = net_utils.post_request(self.base_url, '/api/projects')
@@ -154,13 +188,29 @@ class Calibration():
 
     def start(self):
         logging.info('Starting calibration')
-        self.calibration_id = self.__create_calibration(self.project_id, self.participant_id)
-        net_utils.post_request(self.base_url, '/api/calibrations/' + self.calibration_id + '/start')
+        try:
+            self.calibration_id = self.__create_calibration(self.project_id, self.participant_id)
+            net_utils.post_request(self.base_url, '/api/calibrations/' + self.calibration_id + '/start')
+        except net_utils.HTTP_ERRORS as e:
+            logging.error('ERROR: Could not start calibration: ' + str(e))
+            return
         self.is_calibrating = True
 
     def update(self):
         if self.is_calibrating:
-            status = net_utils.wait_for_status(self.base_url, '/api/calibrations/' + self.calibration_id + '/status', 'ca_state', ['failed', 'calibrated'])
+            # poll at a bounded rate, a request can block for up to HTTP_TIMEOUT
+            if time.time() < self.next_poll:
+                return None
+            try:
+                status = net_utils.wait_for_status(self.base_url, '/api/calibrations/' + self.calibration_id + '/status', 'ca_state', ['failed', 'calibrated'])
+            except net_utils.HTTP_ERRORS as e:
+                # link is down, back off and poll again later
+                logging.debug('Calibration status not available: ' + str(e))
+                self.poll_interval = min(self.poll_interval * 2, config.RECONNECT_BACKOFF_MAX)
+                self.next_poll = time.time() + self.poll_interval
+                return None
+            self.poll_interval = config.CALIBRATION_POLL_INTERVAL
+            self.next_poll = time.time() + self.poll_interval
             if status is not None:
                 self.is_calibrating = False
             return status
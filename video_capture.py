@@ -21,7 +21,10 @@ import numpy as np
 import cv2
 from ctypes import c_uint8
 import os
+import time
 import logging
+import config
+import net_utils
 
 # shared memomry IPC not supported on windows, use threads
 USE_THREADING = False or os.name == 'nt'
@@ -31,57 +34,125 @@ class CaptureProcess():
     def __init__(self, url, dims, use_multi):
         self.url = url
         self.use_multi = use_multi
-        if self.use_multi:
-            template = np.zeros(dims, np.uint8)
-            self.arrayQueue = ArrayQueue(template, 1)
-            if USE_THREADING:
-                self.exitFlag = threading.Event()
-                self.subProcess = threading.Thread(target=subprocess, args=(url, self.arrayQueue, self.exitFlag))
-            else:
-                self.exitFlag = mp.Event()
-                self.subProcess = mp.Process(target=subprocess, args=(url, self.arrayQueue, self.exitFlag))
-
+        self.template = np.zeros(dims, np.uint8)
+        # number of stream reopens, shared with the capture process
+        self.reopen_count = mp.Value('i', 0, lock=False)
+        self.respawns = 0 # number of times a blocked capture process was replaced
+
+    def __spawn(self):
+        # a fresh queue, the previous process may have died holding one of its buffers
+        self.arrayQueue = ArrayQueue(self.template, 1)
+        if USE_THREADING:
+            self.exitFlag = threading.Event()
+            self.subProcess = threading.Thread(target=subprocess, args=(self.url, self.arrayQueue, self.exitFlag, self.reopen_count))
+            self.subProcess.daemon = True
+        else:
+            self.exitFlag = mp.Event()
+            self.subProcess = mp.Process(target=subprocess, args=(self.url, self.arrayQueue, self.exitFlag, self.reopen_count))
+        self.subProcess.start()
 
     def start(self):
         if self.use_multi:
-            self.subProcess.start()
+            self.__spawn()
         else:
             # multiprocessing disabled
-            self.cap = cv2.VideoCapture(self.url)
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 3);
+            self.cap = ReconnectingCapture(self.url, self.reopen_count)
+
+    def restart(self):
+        ''' replace a capture process which is blocked on a dead stream '''
+        if not self.use_multi:
+            # synchronous capture relies on the backend timeouts and reopens by itself
+            return
+        self.exitFlag.set()
+        if USE_THREADING:
+            # threads cannot be killed, the old one exits once its read returns
+            pass
+        else:
+            self.subProcess.terminate()
+            self.subProcess.join()
+        self.respawns += 1
+        self.__spawn()
 
-    def read(self):
+    def reopens(self):
+        ''' number of times the video stream was reopened '''
+        return self.reopen_count.value
+
+    def read(self, timeout=0.1):
+        ''' return the next (frame, pts), or (None, None) if no frame arrived in time '''
         if self.use_multi:
-            return self.arrayQueue.get()
+            item = self.arrayQueue.get(timeout)
+            if item is None:
+                return None, None
+            return item
         else:
             # multiprocessing disabled, read frame synchronously
-            ret, frame = self.cap.read() # capture one frame
-            pts = int(self.cap.get(cv2.CAP_PROP_POS_MSEC)) # get pts
-            return frame, pts
+            return self.cap.read()
 
 
     def stop(self):
         # terminate child process / thread
         if self.use_multi:
             self.exitFlag.set()
-            self.subProcess.join()
+            self.subProcess.join(config.VIDEO_OPEN_TIMEOUT)
+            if not USE_THREADING and self.subProcess.is_alive():
+                self.subProcess.terminate()
         else:
             self.cap.release()
 
 
-def subprocess(url, arrayQueue, exitFlag):
+def subprocess(url, arrayQueue, exitFlag, reopen_count):
     ''' run the capture process asynchronously '''
-    cap = cv2.VideoCapture(url)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 3);
+    cap = ReconnectingCapture(url, reopen_count)
 
     while not exitFlag.is_set():
-        ret, frame = cap.read() # capture one frame
-        pts = int(cap.get(cv2.CAP_PROP_POS_MSEC)) # get pts
-        arrayQueue.put(frame, pts)
+        frame, pts = cap.read() # capture one frame
+        if frame is not None:
+            arrayQueue.put(frame, pts)
 
     cap.release()
 
 
+class ReconnectingCapture():
+    ''' capture video frames, reopening the stream when reads keep failing '''
+    def __init__(self, url, reopen_count):
+        self.url = url
+        self.reopen_count = reopen_count
+        self.stall = net_utils.StallDetector(config.VIDEO_STALL_TIMEOUT, config.RECONNECT_BACKOFF_MIN, config.RECONNECT_BACKOFF_MAX)
+        self.__open()
+
+    def __open(self):
+        if hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+            # bound the backend's blocking open and read (OpenCV 4.6+)
+            params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(config.VIDEO_OPEN_TIMEOUT * 1000),
+                      cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(config.VIDEO_STALL_TIMEOUT * 1000)]
+            self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG, params)
+        else:
+            self.cap = cv2.VideoCapture(self.url)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 3);
+        # opening can block for a while, start timing from here
+        self.stall.reset()
+
+    def read(self):
+        ''' return (frame, pts), or (None, None) if the stream is down '''
+        ret, frame = self.cap.read() # capture one frame
+        if ret and frame is not None:
+            self.stall.feed()
+            pts = int(self.cap.get(cv2.CAP_PROP_POS_MSEC)) # get pts
+            return frame, pts
+        if self.stall.poll():
+            logging.warning('WARNING: Video reads failing, reopening ' + self.url)
+            self.cap.release()
+            self.__open()
+            self.reopen_count.value += 1
+        else:
+            # don't spin on a broken stream
+            time.sleep(0.01)
+        return None, None
+
+    def release(self):
+        self.cap.release()
+
+
 
 # https://stackoverflow.com/questions/38666078/fast-queue-of-read-only-numpy-arrays
 class ArrayQueue(object):
@@ -113,6 +184,7 @@ class ArrayQueue(object):
         self.q = mp.Queue(maxsize)
 
     def put(self, item, pts):
+        ''' queue a copy of item, return False if the queue is full and item was dropped '''
         if item.dtype == self.dtype and item.shape == self.shape and len(item.data)==self.byte_count:
             # get the ID of an available shared-memory array
             try:
@@ -120,17 +192,21 @@ class ArrayQueue(object):
             except Queue.Empty:
                 # buffer is full, just drop the frame
                 #print 'FRAME DROPPED'
-                return
+                return False
             # copy item to the shared-memory array
             #self.array_pool[arrayid][:] = item
             np.copyto(self.array_pool[arrayid], item)
             # put the array's id (not the whole array) onto the queue
             self.q.put((arrayid, pts))
+            return True
         else:
             raise ValueError('ndarray does not match type or shape of template used to initialize ArrayQueue')
 
-    def get(self):
-        items = self.q.get()
+    def get(self, timeout=None):
+        try:
+            items = self.q.get(True, timeout)
+        except Queue.Empty:
+            return None
         arrayid = items[0]
         pts = items[1]
         # item is the id of a shared-memory array
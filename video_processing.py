@@ -28,13 +28,28 @@ import numpy
 def nothing(x):
     pass
 
+def draw_overlays(image, corners, gaze, lastid):
+    ''' draw detected markers, gaze position and last hit on image (in place) '''
+    annotated = aruco.drawDetectedMarkers(image, corners)
+    if gaze is not None:
+        cv2.circle(annotated, gaze, 10, (0, 0, 255), 4)
+        # annotate fiducial id on frame
+        if lastid is not None:
+            cv2.putText(annotated, str(lastid), (100, 200), cv2.FONT_HERSHEY_SIMPLEX, 4, (0, 255, 0), 2, cv2.LINE_AA)
+    return annotated
+
 class VideoProcessing():
     ''' Detect Fiducial and check if gaze position falls within ROI '''
 
-    def __init__(self, peer):
+    def __init__(self, peer, recorder=None):
         self.output_filters = OutputFilters()
+        self.recorder = recorder
+        self.board = None
+        if len(config.BOARD_LAYOUT) > 0:
+            self.board = BoardMapping(config.BOARD_LAYOUT)
         self.lastid = None
         self.lastpts = 0
+        self.peer = peer
         # start video Keep-Alive
         self.sock = net_utils.mksock(peer)
         self.keepalive = tobii_api.KeepAlive(self.sock, peer, 'video')
@@ -55,16 +70,37 @@ class VideoProcessing():
             cv2.createTrackbar('Y Offset', self.param_window, config.GAZE_OFFSET_Y+100, 200, nothing)
             cv2.createTrackbar('Threshold', self.param_window, config.GAZE_THRESHOLD, 30, nothing)
 
+    def restart(self):
+        ''' reopen the Livestream video session '''
+        self.keepalive.stop()
+        self.sock.close()
+        self.sock = net_utils.mksock(self.peer)
+        self.keepalive = tobii_api.KeepAlive(self.sock, self.peer, 'video')
+
     def detect(self, frame, data):
         # detect aruco fiducials
-        corners, ids, rejectedImgPoints = aruco.detectMarkers(frame, self.aruco_dict, parameters=self.parameters)
-        annotated =  aruco.drawDetectedMarkers(frame, corners)
-        serialout = None
+        corners, ids = [], None
+        detected = self.board is None or self.board.detect_due()
+        if detected:
+            corners, ids, rejectedImgPoints = aruco.detectMarkers(frame, self.aruco_dict, parameters=self.parameters)
+        useboard = self.board is not None and self.board.update(corners, ids, detected)
+        rois = corners
+        if useboard:
+            # resolve against the whole board, including occluded or missed markers
+            rois = self.board.project()
+            if not detected and len(self.board.visible) > 0:
+                # detection skipped, track the markers seen on the last detection frame
+                corners = self.board.project(self.board.visible)
+                ids = numpy.array(self.board.visible, numpy.int32).reshape(-1, 1)
+        hitid = None
+        angledist = None
+        detectedid = None
+        gaze = None
 
         if data is not None:
             rows = frame.shape[0]
             cols = frame.shape[1]
-            # convert to pixel coords and annotate image
+            # convert to pixel coords
             offsetx = config.GAZE_OFFSET_X
             offsety = config.GAZE_OFFSET_Y
             if not config.HEADLESS:
@@ -72,11 +108,12 @@ class VideoProcessing():
                 offsety = cv2.getTrackbarPos('Y Offset', self.param_window) - 100
             gazex = int(round(cols*data['gp'][0])) - offsetx
             gazey = int(round(rows*data['gp'][1])) - offsety
-            if not config.HEADLESS:
-                cv2.circle(annotated, (gazex, gazey), 10, (0, 0, 255), 4)
+            gaze = (gazex, gazey)
+            if useboard:
+                hitid = self.board.lookup(gaze)
 
-            detectedid = None
-            # check if gaze position falls within roi
+            # compute distances to markers in view and check if gaze position falls within roi,
+            # board markers are resolved by the board lookup
             if len(corners) > 0 and ids is not None:
                 for roi, id in zip(corners, ids):
 
@@ -88,31 +125,33 @@ class VideoProcessing():
                         angle = numpy.arctan2((gazey-cYroi),(gazex-cXroi))*180/numpy.pi
                         if angle<0:
                             angle = angle + 360
-                        serialout = (str(int(distance)).zfill(4)+str(int(angle)).zfill(4))
-                        logging.info('Marker ' +str(id) + ' centre ' + str(cXroi) + ',' + str(cYroi) + "distance " + str(distance) + "Angle: " + str(angle) + "Serialout: " + serialout)
-                    if cv2.pointPolygonTest(roi, (gazex, gazey), False) >= 0:
-                        threshold = config.GAZE_THRESHOLD
-                        if not config.HEADLESS:
-                            threshold = cv2.getTrackbarPos('Threshold', self.param_window)
-                        self.output_filters.set_threshold(threshold)
-                        detectedid = self.output_filters.process(id[0])
-                        if detectedid is not None:
-                            logging.info('DETECTED MARKER ' + str(detectedid))
-                            self.lastid = detectedid
+                        angledist = (distance, angle)
+                        logging.info('Marker ' +str(id) + ' centre ' + str(cXroi) + ',' + str(cYroi) + "distance " + str(distance) + "Angle: " + str(angle))
+                    onboard = useboard and id[0] in self.board.rois
+                    if hitid is None and not onboard and cv2.pointPolygonTest(roi, (gazex, gazey), False) >= 0:
+                        hitid = id[0]
+                    if hitid == id[0]:
                         break
 
-            # annotate fiducial id on frame
-            if  self.lastid is not None and not config.HEADLESS:
-                cv2.putText(annotated, str(self.lastid), (100, 200), cv2.FONT_HERSHEY_SIMPLEX, 4, (0, 255, 0), 2, cv2.LINE_AA)
+            if hitid is not None:
+                threshold = config.GAZE_THRESHOLD
+                if not config.HEADLESS:
+                    threshold = cv2.getTrackbarPos('Threshold', self.param_window)
+                self.output_filters.set_threshold(threshold)
+                detectedid = self.output_filters.process(hitid)
+                if detectedid is not None:
+                    logging.info('DETECTED MARKER ' + str(detectedid))
+                    self.lastid = detectedid
 
-            # display image
-            if not config.HEADLESS:
-                cv2.imshow(self.image_window, annotated)
-            return detectedid, serialout
-        else:
-            if not config.HEADLESS:
-                cv2.imshow(self.image_window, annotated)
-            return None, serialout
+        # hand the raw frame over to the recorder before drawing on it
+        if self.recorder is not None:
+            self.recorder.write(frame, rois, gaze, self.lastid)
+
+        # annotate and display image
+        if not config.HEADLESS:
+            annotated = draw_overlays(frame, rois, gaze, self.lastid)
+            cv2.imshow(self.image_window, annotated)
+        return detectedid, angledist
 
     def stop(self):
         self.keepalive.stop()
@@ -120,6 +159,105 @@ class VideoProcessing():
             cv2.destroyAllWindows()
 
 
+class BoardMapping():
+    ''' map gaze to a declared marker board layout through a cached homography '''
+
+    def __init__(self, layout):
+        # marker corners in board coords, in aruco order (clockwise from top-left)
+        self.rois = {}
+        for id, (x, y, size) in layout.items():
+            self.rois[id] = numpy.array([[x, y], [x+size, y], [x+size, y+size], [x, y+size]], numpy.float32)
+        self.ids = sorted(self.rois.keys())
+        self.visible = [] # board markers seen on the last detection frame
+        self.homography = None # board to image
+        self.inverse = None # image to board
+        self.age = 0
+        self.frame = 0
+
+        # spatial index: uniform grid of cells holding the ids of overlapping markers
+        self.cell = max(size for (x, y, size) in layout.values())
+        self.grid = {}
+        for id, roi in self.rois.items():
+            x0, y0 = roi.min(axis=0) // self.cell
+            x1, y1 = roi.max(axis=0) // self.cell
+            for cx in range(int(x0), int(x1)+1):
+                for cy in range(int(y0), int(y1)+1):
+                    self.grid.setdefault((cx, cy), []).append(id)
+
+    def valid(self):
+        return self.homography is not None and self.age <= config.BOARD_MAX_AGE
+
+    def detect_due(self):
+        ''' check whether markers should be detected on this frame '''
+        self.frame += 1
+        return not self.valid() or self.frame % config.BOARD_DETECT_INTERVAL == 0
+
+    def update(self, corners, ids, detected):
+        ''' update the homography from visible board markers, return True if it is usable '''
+        self.age += 1
+        if not detected:
+            # detection skipped, keep using the cached homography while it is fresh
+            return self.valid()
+        imgpts = []
+        boardpts = []
+        self.visible = []
+        if ids is not None:
+            for roi, id in zip(corners, ids):
+                if id[0] in self.rois:
+                    imgpts.append(roi.reshape(4, 2))
+                    boardpts.append(self.rois[id[0]])
+                    self.visible.append(id[0])
+        if len(imgpts) == 0:
+            # the board is out of view, drop the cache rather than hit-test a stale board
+            self.__drop()
+            return False
+        imgpts = numpy.concatenate(imgpts)
+        boardpts = numpy.concatenate(boardpts)
+
+        if len(self.visible) < config.BOARD_MIN_MARKERS:
+            # too few markers for a reliable estimate, keep the cached one while it still fits them
+            if self.valid() and self.__error(boardpts, imgpts) <= config.BOARD_REPROJECTION_ERROR:
+                return True
+            self.__drop()
+            return False
+
+        method = cv2.RANSAC if len(self.visible) > 1 else 0
+        homography, mask = cv2.findHomography(boardpts, imgpts, method, config.BOARD_REPROJECTION_ERROR)
+        if homography is None:
+            self.__drop()
+            return False
+        self.homography = homography / homography[2, 2]
+        self.inverse = numpy.linalg.inv(homography)
+        self.age = 0
+        return True
+
+    def __drop(self):
+        self.homography = None
+        self.inverse = None
+
+    def __error(self, boardpts, imgpts):
+        # max reprojection error of board points under the cached homography, in pixels
+        projected = cv2.perspectiveTransform(boardpts.reshape(-1, 1, 2), self.homography).reshape(-1, 2)
+        return numpy.linalg.norm(projected - imgpts, axis=1).max()
+
+    def project(self, ids=None):
+        ''' return the corners of board markers (all by default) in image coords, like aruco.detectMarkers '''
+        if ids is None:
+            ids = self.ids
+        board = numpy.array([self.rois[id] for id in ids], numpy.float32).reshape(-1, 1, 2)
+        projected = cv2.perspectiveTransform(board, self.homography).reshape(-1, 1, 4, 2)
+        return [roi for roi in projected]
+
+    def lookup(self, point):
+        ''' return the id of the board marker under an image point, or None '''
+        p = cv2.perspectiveTransform(numpy.array([[point]], numpy.float32), self.inverse)[0][0]
+        x, y = float(p[0]), float(p[1])
+        for id in self.grid.get((int(x // self.cell), int(y // self.cell)), []):
+            if cv2.pointPolygonTest(self.rois[id], (x, y), False) >= 0:
+                return id
+        return None
+
+
 class OutputFilters():
     ''' filter detections '''
 
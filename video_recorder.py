@@ -0,0 +1,95 @@
+#   Gaze Control - A real-time control application for Tobii Pro Glasses 2.
+#
+#   Copyright 2017 Shadi El Hajj
+#
+#   Licensed under the Apache License, Version 2.0 (the 'License');
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an 'AS IS' BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import multiprocessing as mp
+import threading
+import numpy as np
+import cv2
+import logging
+import config
+import video_processing as vp
+from video_capture import ArrayQueue, USE_THREADING
+
+class RecordProcess():
+    ''' start a separate process (or thread) to annotate and encode video frames '''
+    def __init__(self, filename, dims):
+        self.filename = filename
+        self.frames = 0 # frames submitted
+        self.dropped = 0 # frames dropped because the encoder fell behind or the frame did not fit
+        self.misfit = False # a frame did not match the recording template
+        self.written = mp.Value('i', 0, lock=False) # frames encoded, updated by the encoder
+        template = np.zeros(dims, np.uint8)
+        self.arrayQueue = ArrayQueue(template, config.RECORD_QUEUE_SIZE)
+        if USE_THREADING:
+            self.exitFlag = threading.Event()
+            self.subProcess = threading.Thread(target=subprocess, args=(filename, self.arrayQueue, self.exitFlag, self.written))
+        else:
+            self.exitFlag = mp.Event()
+            self.subProcess = mp.Process(target=subprocess, args=(filename, self.arrayQueue, self.exitFlag, self.written))
+
+    def start(self):
+        self.subProcess.start()
+
+    def write(self, frame, corners, gaze, lastid):
+        ''' queue a frame and its overlay metadata, never blocks '''
+        self.frames += 1
+        try:
+            queued = self.arrayQueue.put(frame, (corners, gaze, lastid))
+        except ValueError:
+            # frame does not match the recording template, eg. a different stream resolution
+            if not self.misfit:
+                logging.warning('WARNING: Frame of shape ' + str(frame.shape) + ' cannot be recorded')
+                self.misfit = True
+            queued = False
+        if not queued:
+            self.dropped += 1
+
+    def stop(self):
+        # terminate child process / thread
+        self.exitFlag.set()
+        self.subProcess.join()
+        lost = self.frames - self.dropped - self.written.value
+        logging.info('Recorded ' + str(self.written.value) + ' frames to ' + self.filename + ', dropped ' + str(self.dropped) + ', not encoded ' + str(lost))
+
+
+def subprocess(filename, arrayQueue, exitFlag, written):
+    ''' draw overlays and encode frames asynchronously '''
+    fourcc = cv2.VideoWriter_fourcc(*config.RECORD_FOURCC)
+    writer = cv2.VideoWriter(filename, fourcc, config.RECORD_FPS, config.RECORD_SIZE)
+    if not writer.isOpened():
+        logging.error('ERROR: Cannot record to ' + filename + ' with codec ' + config.RECORD_FOURCC)
+        return
+
+    def encode(item):
+        frame, (corners, gaze, lastid) = item
+        annotated = vp.draw_overlays(frame, corners, gaze, lastid)
+        if (annotated.shape[1], annotated.shape[0]) != config.RECORD_SIZE:
+            annotated = cv2.resize(annotated, config.RECORD_SIZE, interpolation=cv2.INTER_AREA)
+        writer.write(annotated)
+        written.value += 1
+
+    while not exitFlag.is_set():
+        item = arrayQueue.get(0.1)
+        if item is not None:
+            encode(item)
+
+    # encode frames still in the queue
+    item = arrayQueue.get(0.1)
+    while item is not None:
+        encode(item)
+        item = arrayQueue.get(0.1)
+
+    writer.release()